@@ -1,21 +1,20 @@
 import os
-import os.path
-import tempfile
 import urllib.request
 import zipfile
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from textwrap import indent
 
+import numpy as np
 import pandas as pd
 import scanpy as sc
 from anndata import AnnData
 
-from ..io._convert_anndata import from_airr_cells
-from ..io._datastructures import AirrCell
-from ..io._io import _infer_locus_from_gene_names, _IOLogger
+from ..io._convert_anndata import _from_airr_df
+from ..io._io import _infer_locus_from_gene_names
 from ..pp import index_chains
-from ..util import _doc_params, _read_to_str, tqdm
+from ..util import _doc_params, _read_to_str
 
 HERE = Path(__file__).parent
 from os import PathLike
@@ -28,7 +27,6 @@ from mudata import MuData
 from scanpy import logging
 
 from .. import __version__
-from ..util import tqdm
 
 _FIGSHARE = pooch.create(
     path=pooch.os_cache("scirpy"),
@@ -57,8 +55,13 @@ _POOCH_INFO = dedent(
 )
 
 
+def _processing_code(script: str) -> str:
+    """Read a processing script and indent it for inclusion in a docstring"""
+    return indent(_read_to_str(HERE / "_processing_scripts" / script), "   ")
+
+
 @_doc_params(
-    processing_code=indent(_read_to_str(HERE / "_processing_scripts/wu2020.py"), "   "),
+    processing_code=_processing_code("wu2020.py"),
     pooch_info=_POOCH_INFO,
 )
 def wu2020() -> MuData:
@@ -80,9 +83,7 @@ def wu2020() -> MuData:
 
 
 @_doc_params(
-    processing_code=indent(
-        _read_to_str(HERE / "_processing_scripts/wu2020_3k.py"), "   "
-    ),
+    processing_code=_processing_code("wu2020_3k.py"),
     pooch_info=_POOCH_INFO,
 )
 def wu2020_3k() -> MuData:
@@ -103,9 +104,7 @@ def wu2020_3k() -> MuData:
 
 
 @_doc_params(
-    processing_code=indent(
-        _read_to_str(HERE / "_processing_scripts/maynard2020.py"), "   "
-    ),
+    processing_code=_processing_code("maynard2020.py"),
     pooch_info=_POOCH_INFO,
 )
 def maynard2020() -> MuData:
@@ -132,6 +131,60 @@ def maynard2020() -> MuData:
     return mudata.read_h5mu(fname)
 
 
+#: Fields from VDJdb that are stored as cell-level metadata
+_VDJDB_META = (
+    "species",
+    "mhc.a",
+    "mhc.b",
+    "mhc.class",
+    "antigen.epitope",
+    "antigen.gene",
+    "antigen.species",
+    "reference.id",
+    "method.identification",
+    "method.frequency",
+    "method.singlecell",
+    "method.sequencing",
+    "method.verification",
+    "meta.study.id",
+    "meta.cell.subset",
+    "meta.subject.cohort",
+    "meta.subject.id",
+    "meta.replica.id",
+    "meta.clone.id",
+    "meta.epitope.id",
+    "meta.tissue",
+    "meta.donor.MHC",
+    "meta.donor.MHC.method",
+    "meta.structure.id",
+    "vdjdb.score",
+)
+#: All columns from VDJdb that are used. Other columns are not parsed.
+_VDJDB_COLS = (
+    "cdr3.alpha",
+    "v.alpha",
+    "j.alpha",
+    "cdr3.beta",
+    "v.beta",
+    "d.beta",
+    "j.beta",
+) + _VDJDB_META
+
+
+@lru_cache(None)
+def _latest_vdjdb_url() -> str:
+    """Retrieve the download URL of the latest VDJdb release.
+
+    The result is cached, such that repeated calls within the same
+    process don't need to query GitHub again.
+    """
+    with urllib.request.urlopen(
+        "https://raw.githubusercontent.com/antigenomics/vdjdb-db/master/latest-version.txt"
+    ) as response:
+        latest_versions = response.read().decode().split()
+    return latest_versions[0]
+
+
 def vdjdb(cached: bool = True, *, cache_path="data/vdjdb.h5ad") -> AnnData:
     """\
     Download VDJdb and process it into an AnnData object.
@@ -146,6 +199,12 @@ def vdjdb(cached: bool = True, *, cache_path="data/vdjdb.h5ad") -> AnnData:
     cache_path
         Location where the h5ad object will be saved
 
+    .. note::
+        The raw database file is downloaded through `Pooch <https://github.com/fatiando/pooch>`_
+        into your operating system's default cache directory (See :func:`pooch.os_cache`)
+        and re-used from there if `cached` is `False`. A new release of VDJdb is downloaded
+        automatically.
+
     Returns
     -------
     An anndata object containing all entries from VDJDB in `obsm["airr"]`.
@@ -159,97 +218,113 @@ def vdjdb(cached: bool = True, *, cache_path="data/vdjdb.h5ad") -> AnnData:
             pass
 
     logging.info("Downloading latest version of VDJDB")
-    with urllib.request.urlopen(
-        "https://raw.githubusercontent.com/antigenomics/vdjdb-db/master/latest-version.txt"
-    ) as url:
-        latest_versions = url.read().decode().split()
-    url = latest_versions[0]
-
-    with tempfile.TemporaryDirectory() as d:
-        d = Path(d)
-        urllib.request.urlretrieve(url, d / "vdjdb.tar.gz")
-        with zipfile.ZipFile(d / "vdjdb.tar.gz") as zf:
-            zf.extractall(d)
-        df = pd.read_csv(d / "vdjdb_full.txt", sep="\t")
-
-    tcr_cells = []
-    for idx, row in tqdm(
-        df.iterrows(), total=df.shape[0], desc="Processing VDJDB entries"
-    ):
-        cell = AirrCell(cell_id=str(idx))
-        if not pd.isnull(row["cdr3.alpha"]):
-            alpha_chain = AirrCell.empty_chain_dict()
-            alpha_chain.update(
-                {
-                    "locus": "TRA",
-                    "junction_aa": row["cdr3.alpha"],
-                    "v_call": row["v.alpha"],
-                    "j_call": row["j.alpha"],
-                    "consensus_count": 0,
-                    "productive": True,
-                }
-            )
-            cell.add_chain(alpha_chain)
-
-        if not pd.isnull(row["cdr3.beta"]):
-            beta_chain = AirrCell.empty_chain_dict()
-            beta_chain.update(
-                {
-                    "locus": "TRB",
-                    "junction_aa": row["cdr3.beta"],
-                    "v_call": row["v.beta"],
-                    "d_call": row["d.beta"],
-                    "j_call": row["j.beta"],
-                    "consensus_count": 0,
-                    "productive": True,
-                }
-            )
-            cell.add_chain(beta_chain)
-
-        INCLUDE_CELL_METADATA_FIELDS = [
-            "species",
-            "mhc.a",
-            "mhc.b",
-            "mhc.class",
-            "antigen.epitope",
-            "antigen.gene",
-            "antigen.species",
-            "reference.id",
-            "method.identification",
-            "method.frequency",
-            "method.singlecell",
-            "method.sequencing",
-            "method.verification",
-            "meta.study.id",
-            "meta.cell.subset",
-            "meta.subject.cohort",
-            "meta.subject.id",
-            "meta.replica.id",
-            "meta.clone.id",
-            "meta.epitope.id",
-            "meta.tissue",
-            "meta.donor.MHC",
-            "meta.donor.MHC.method",
-            "meta.structure.id",
-            "vdjdb.score",
-        ]
-        for f in INCLUDE_CELL_METADATA_FIELDS:
-            cell[f] = row[f]
-        tcr_cells.append(cell)
+    url = _latest_vdjdb_url()
+
+    # The release archive is versioned by its file name, so it can safely be re-used
+    # from the pooch cache. VDJdb releases are zip archives; only the table we need
+    # is decompressed instead of extracting the whole archive.
+    archive = pooch.retrieve(
+        url,
+        known_hash=None,
+        fname=url.rsplit("/", 1)[-1],
+        path=pooch.os_cache("scirpy"),
+        progressbar=True,
+    )
+    with zipfile.ZipFile(archive) as zf:
+        member = next((n for n in zf.namelist() if n.endswith("vdjdb_full.txt")), None)
+        if member is None:
+            raise ValueError(f"`vdjdb_full.txt` not found in VDJdb archive {archive}")
+        with zf.open(member) as f:
+            df = pd.read_csv(f, sep="\t", usecols=list(_VDJDB_COLS), low_memory=False)
+
+    # build the long-format AIRR table (one row per chain) directly from the columns
+    cell_ids = df.index.astype(str).to_numpy()
+    alpha_present = df["cdr3.alpha"].notna().to_numpy()
+    beta_present = df["cdr3.beta"].notna().to_numpy()
+    alpha_df = pd.DataFrame(
+        {
+            "cell_id": cell_ids,
+            "locus": "TRA",
+            "junction_aa": df["cdr3.alpha"].to_numpy(),
+            "v_call": df["v.alpha"].to_numpy(),
+            "j_call": df["j.alpha"].to_numpy(),
+            "consensus_count": 0,
+            "productive": True,
+        }
+    ).loc[alpha_present]
+    beta_df = pd.DataFrame(
+        {
+            "cell_id": cell_ids,
+            "locus": "TRB",
+            "junction_aa": df["cdr3.beta"].to_numpy(),
+            "v_call": df["v.beta"].to_numpy(),
+            "d_call": df["d.beta"].to_numpy(),
+            "j_call": df["j.beta"].to_numpy(),
+            "consensus_count": 0,
+            "productive": True,
+        }
+    ).loc[beta_present]
+    airr_df = pd.concat([alpha_df, beta_df], ignore_index=True)
 
     logging.info("Converting to AnnData object")
-    adata = from_airr_cells(tcr_cells)
+    obs = pd.DataFrame(
+        {f: df[f].to_numpy() for f in _VDJDB_META},
+        index=pd.Index(cell_ids, name="cell_id"),
+    )
+    adata = _from_airr_df(obs, airr_df)
     index_chains(adata)
 
-    adata.uns["DB"] = {"name": "VDJDB", "date_downloaded": datetime.now().isoformat()}
+    # the archive may have been re-used from the pooch cache
+    adata.uns["DB"] = {
+        "name": "VDJDB",
+        "date_downloaded": datetime.fromtimestamp(
+            os.path.getmtime(archive)
+        ).isoformat(),
+    }
 
-    # store cache
-    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
-    adata.write_h5ad(cast(os.PathLike, cache_path))
+    # store cache. The tables consist of highly redundant strings and compress well.
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    adata.write_h5ad(
+        cast(os.PathLike, cache_path), compression="gzip", compression_opts=4
+    )
 
     return adata
 
 
+#: Fields from IEDB that are stored as cell-level metadata
+_IEDB_META = (
+    "Receptor ID",
+    "Antigen",
+    "Organism",
+    "Response Type",
+    "Reference IRI",
+    "Epitope IRI",
+)
+#: Columns from IEDB with chain-level information. The curated values
+#: are complemented by the calculated ones if missing.
+_IEDB_CURATED_COLS = (
+    "Chain 1 CDR3 Curated",
+    "Chain 2 CDR3 Curated",
+    "Curated Chain 1 V Gene",
+    "Curated Chain 2 V Gene",
+    "Curated Chain 1 D Gene",
+    "Curated Chain 2 D Gene",
+    "Curated Chain 1 J Gene",
+    "Curated Chain 2 J Gene",
+)
+#: Calculated counterparts of the curated columns
+_IEDB_CALCULATED_COLS = tuple(
+    c.replace("Curated", "Calculated") for c in _IEDB_CURATED_COLS
+)
+#: All columns from IEDB that are used. Other columns are not parsed.
+_IEDB_COLS = (
+    _IEDB_META
+    + ("Chain 1 Type", "Chain 2 Type")
+    + _IEDB_CURATED_COLS
+    + _IEDB_CALCULATED_COLS
+)
+
+
 def iedb(cached: bool = True, *, cache_path="data/iedb.h5ad") -> AnnData:
     """\
     Download IEBD v3 and process it into an AnnData object.
@@ -264,6 +339,12 @@ def iedb(cached: bool = True, *, cache_path="data/iedb.h5ad") -> AnnData:
     cache_path
         Location where the h5ad object will be saved
 
+    .. note::
+        The raw database file is downloaded through `Pooch <https://github.com/fatiando/pooch>`_
+        into your operating system's default cache directory (See :func:`pooch.os_cache`)
+        and re-used from there if `cached` is `False`. Delete it from the cache directory
+        to force downloading the latest version.
+
     Returns
     -------
     An anndata object containing all entries from IEDB in `obsm["airr"]`.
@@ -276,17 +357,44 @@ def iedb(cached: bool = True, *, cache_path="data/iedb.h5ad") -> AnnData:
         except OSError:
             pass
 
-    logger = _IOLogger()
-    iedb_df = pd.read_csv(
+    logging.info("Downloading IEDB")
+    archive = pooch.retrieve(
         "https://www.iedb.org/downloader.php?file_name=doc/receptor_full_v3.zip",
-        index_col=None,
-        sep=",",
-        na_values=["None"],
-        true_values=["True"],
-        low_memory=False,
+        known_hash=None,
+        fname="iedb_receptor_full_v3.zip",
+        path=pooch.os_cache("scirpy"),
+        progressbar=True,
+    )
+    # Decompress the table from the archive ourselves and only hand the already
+    # decompressed stream to the CSV parser.
+    with zipfile.ZipFile(archive) as zf, zf.open(zf.namelist()[0]) as f:
+        iedb_df = pd.read_csv(
+            f,
+            index_col=None,
+            sep=",",
+            na_values=["None"],
+            true_values=["True"],
+            usecols=list(_IEDB_COLS),
+            dtype={c: str for c in _IEDB_CURATED_COLS + _IEDB_CALCULATED_COLS},
+            low_memory=False,
+        )
+
+    # low-cardinality columns: makes filtering, deduplication and mapping cheaper
+    categorical_cols = ["Organism", "Response Type", "Chain 1 Type", "Chain 2 Type"]
+    iedb_df[categorical_cols] = iedb_df[categorical_cols].astype("category")
+
+    # Filter for supported chain types first, such that all subsequent steps operate on
+    # a smaller table. Both columns are part of the deduplication keys below, so the
+    # order of filtering and deduplication doesn't change the result.
+    accepted_chains = ["alpha", "beta", "heavy", "light", "gamma", "delta"]
+    mask = (
+        iedb_df["Chain 1 Type"].isin(accepted_chains).to_numpy()
+        & iedb_df["Chain 2 Type"].isin(accepted_chains).to_numpy()
     )
+    iedb_df = iedb_df.loc[mask]
 
-    iedb_df = iedb_df.drop_duplicates()
+    # Rows that are complete duplicates are also duplicates with respect to these keys,
+    # so there is no need to deduplicate on all columns first.
     iedb_df = iedb_df.drop_duplicates(
         [
             "Chain 1 CDR3 Curated",
@@ -297,29 +405,16 @@ def iedb(cached: bool = True, *, cache_path="data/iedb.h5ad") -> AnnData:
             "Chain 1 Type",
             "Chain 2 Type",
         ]
-    )
+    ).reset_index(drop=True)
 
     # If no curated CDR3 sequence or V/D/J gene is available, the calculated one is used.
-    def replace_curated(input_1, input_2):
-        calculated_1 = input_1.replace("Curated", "Calculated")
-        iedb_df.loc[iedb_df[input_1].isna(), input_1] = iedb_df[calculated_1]
-        iedb_df[input_1] = iedb_df[input_1].str.upper()
-        calculated_2 = input_2.replace("Curated", "Calculated")
-        iedb_df.loc[iedb_df[input_2].isna(), input_2] = iedb_df[calculated_2]
-        iedb_df[input_2] = iedb_df[input_2].str.upper()
+    for col in _IEDB_CURATED_COLS:
+        calculated = col.replace("Curated", "Calculated")
+        # `fillna` downcasts to float if both columns are entirely missing
+        filled = iedb_df[col].fillna(iedb_df[calculated]).astype(object)
+        iedb_df[col] = filled.str.upper()
 
-    replace_curated("Chain 1 CDR3 Curated", "Chain 2 CDR3 Curated")
-    replace_curated("Curated Chain 1 V Gene", "Curated Chain 2 V Gene")
-    replace_curated("Curated Chain 1 D Gene", "Curated Chain 2 D Gene")
-    replace_curated("Curated Chain 1 J Gene", "Curated Chain 2 J Gene")
-
-    iedb_df["cell_id"] = iedb_df.reset_index(drop=True).index
-
-    accepted_chains = ["alpha", "beta", "heavy", "light", "gamma", "delta"]
-    iedb_df = iedb_df[
-        (iedb_df["Chain 1 Type"].isin(accepted_chains))
-        & (iedb_df["Chain 2 Type"].isin(accepted_chains))
-    ]
+    iedb_df["cell_id"] = np.arange(len(iedb_df), dtype=np.int64)
 
     receptor_dict = {
         "alpha": "TRA",
@@ -331,61 +426,82 @@ def iedb(cached: bool = True, *, cache_path="data/iedb.h5ad") -> AnnData:
         "delta": "TRD",
     }
 
-    tcr_cells = []
-    for _, row in iedb_df.iterrows():
-        cell = AirrCell(cell_id=row["cell_id"], logger=logger)
-        chain1 = AirrCell.empty_chain_dict()
-        chain2 = AirrCell.empty_chain_dict()
-        cell["Receptor ID"] = row["Receptor ID"]
-        cell["Antigen"] = row["Antigen"]
-        cell["Organism"] = row["Organism"]
-        cell["Response Type"] = row["Response Type"]
-        cell["Reference IRI"] = row["Reference IRI"]
-        cell["Epitope IRI"] = row["Epitope IRI"]
-        chain1.update(
-            {
-                "locus": receptor_dict[row["Chain 1 Type"]],
-                "junction_aa": row["Chain 1 CDR3 Curated"],
-                "junction": None,
-                "consensus_count": None,
-                "v_call": row["Curated Chain 1 V Gene"],
-                "d_call": None,
-                "j_call": row["Curated Chain 1 J Gene"],
-                "productive": True,
+    def map_locus(chain_type_col, gene_cols):
+        """Map IEDB chain types to IMGT locus names for all rows at once.
+
+        Since IEDB does not distinguish between lambda and kappa light chains, we need
+        to call them from the gene names. This only affects the (small) subset of light chains.
+        `gene_cols` are the columns with the V, D and J genes (`None` if not available).
+        """
+        locus = iedb_df[chain_type_col].map(receptor_dict).to_numpy(dtype=object)
+        for i in np.flatnonzero(pd.isna(locus)):
+            chain_dict = {
+                k: None if col is None else iedb_df[col].iat[i]
+                for k, col in zip(["v_call", "d_call", "j_call"], gene_cols)
             }
-        )
-        chain2.update(
-            {
-                "locus": receptor_dict[row["Chain 2 Type"]],
-                "junction_aa": row["Chain 2 CDR3 Curated"],
-                "junction": None,
-                "consensus_count": None,
-                "v_call": row["Curated Chain 2 V Gene"],
-                "d_call": row["Curated Chain 2 D Gene"],
-                "j_call": row["Curated Chain 2 J Gene"],
-                "productive": True,
-            }
-        )
-        for chain_dict in [chain1, chain2]:
-            # Since IEDB does not distinguish between lambda and kappa light chains, we need
-            # to call them from the gene names
-            if chain_dict["locus"] is None:
-                chain_dict["locus"] = _infer_locus_from_gene_names(
-                    chain_dict, keys=("v_call", "d_call", "j_call")
-                )
-            cell.add_chain(chain_dict)
-
-        tcr_cells.append(cell)
+            locus[i] = _infer_locus_from_gene_names(
+                chain_dict, keys=("v_call", "d_call", "j_call")
+            )
+        return locus
+
+    # build the long-format AIRR table (one row per chain) directly from the columns
+    cell_ids = iedb_df["cell_id"].astype(str).to_numpy()
+    chain1_df = pd.DataFrame(
+        {
+            "cell_id": cell_ids,
+            "locus": map_locus(
+                "Chain 1 Type",
+                ["Curated Chain 1 V Gene", None, "Curated Chain 1 J Gene"],
+            ),
+            "junction_aa": iedb_df["Chain 1 CDR3 Curated"].to_numpy(),
+            "consensus_count": None,
+            "v_call": iedb_df["Curated Chain 1 V Gene"].to_numpy(),
+            "d_call": None,
+            "j_call": iedb_df["Curated Chain 1 J Gene"].to_numpy(),
+            "productive": True,
+        }
+    )
+    chain2_df = pd.DataFrame(
+        {
+            "cell_id": cell_ids,
+            "locus": map_locus(
+                "Chain 2 Type",
+                [
+                    "Curated Chain 2 V Gene",
+                    "Curated Chain 2 D Gene",
+                    "Curated Chain 2 J Gene",
+                ],
+            ),
+            "junction_aa": iedb_df["Chain 2 CDR3 Curated"].to_numpy(),
+            "consensus_count": None,
+            "v_call": iedb_df["Curated Chain 2 V Gene"].to_numpy(),
+            "d_call": iedb_df["Curated Chain 2 D Gene"].to_numpy(),
+            "j_call": iedb_df["Curated Chain 2 J Gene"].to_numpy(),
+            "productive": True,
+        }
+    )
+    airr_df = pd.concat([chain1_df, chain2_df], ignore_index=True)
 
     logging.info("Converting to AnnData object")
-    iedb = from_airr_cells(tcr_cells)
-    iedb_df = iedb_df.set_index(iedb.obs.index)
-
-    iedb.uns["DB"] = {"name": "IEDB", "date_downloaded": datetime.now().isoformat()}
+    obs = pd.DataFrame(
+        {f: iedb_df[f].to_numpy() for f in _IEDB_META},
+        index=pd.Index(cell_ids, name="cell_id"),
+    )
+    iedb = _from_airr_df(obs, airr_df)
+
+    # the archive may have been re-used from the pooch cache
+    iedb.uns["DB"] = {
+        "name": "IEDB",
+        "date_downloaded": datetime.fromtimestamp(
+            os.path.getmtime(archive)
+        ).isoformat(),
+    }
     index_chains(iedb)
 
-    # store cache
-    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
-    iedb.write_h5ad(cast(os.PathLike, cache_path))
+    # store cache. The tables consist of highly redundant strings and compress well.
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    iedb.write_h5ad(
+        cast(os.PathLike, cache_path), compression="gzip", compression_opts=4
+    )
 
     return iedb
@@ -2,11 +2,13 @@
 from typing import Iterable, List, cast
 
 import awkward as ak
+import numpy as np
 import pandas as pd
+from airr import RearrangementSchema
 from anndata import AnnData
 
 from .. import __version__
-from ..util import DataHandler, _doc_params
+from ..util import DataHandler, _doc_params, _is_na
 from ._datastructures import AirrCell
 from ._util import _IOLogger, doc_working_model
 
@@ -54,6 +56,58 @@ def from_airr_cells(airr_cells: Iterable[AirrCell], key_added: str = "airr") ->
     return adata
 
 
+def _from_airr_df(
+    obs: pd.DataFrame, airr_df: pd.DataFrame, key_added: str = "airr"
+) -> AnnData:
+    """\
+    Build an AnnData object from cell-level attributes and a long-format table of chains.
+
+    Unlike :func:`from_airr_cells`, this operates on columns and doesn't require to
+    create python objects for each cell or chain.
+
+    Parameters
+    ----------
+    obs
+        Data frame with cell-level attributes. The index needs to consist of strings and
+        is used as cell id.
+    airr_df
+        Data frame following the AIRR rearrangement schema with one row per chain.
+        The `cell_id` column assigns each chain to a row in `obs`. Within a cell, chains
+        are stored in the order of `airr_df`. Missing values are normalized the same way
+        as in :meth:`~scirpy.io.AirrCell.add_chain` and required AIRR fields that are
+        not present are set to `None`.
+    key_added
+        Key under which the chains are stored in `obsm`.
+    """
+    cell_idx = obs.index.get_indexer(airr_df["cell_id"])
+    if np.any(cell_idx < 0):
+        raise ValueError("All `cell_id`s of the chains need to be present in `obs`.")
+    order = np.argsort(cell_idx, kind="stable")
+    counts = np.bincount(cell_idx, minlength=obs.shape[0])
+
+    fields = sorted(
+        (set(RearrangementSchema.required) | set(airr_df.columns)) - {"cell_id"}
+    )
+    columns = {}
+    for field in fields:
+        if field in airr_df.columns:
+            values = airr_df[field].to_numpy(dtype=object)[order]
+            values[_is_na(values)] = None
+        else:
+            values = np.full(len(airr_df), None, dtype=object)
+        columns[field] = ak.from_iter(values.tolist())
+
+    # depth_limit=1 is required as strings would otherwise be zipped character-wise
+    chains = ak.unflatten(ak.zip(columns, depth_limit=1), counts)
+
+    return AnnData(
+        X=None,
+        obs=obs,
+        obsm={key_added: chains},
+        uns={"scirpy_version": __version__},
+    )
+
+
 @DataHandler.inject_param_docs()
 def to_airr_cells(
     adata: DataHandler.TYPE, *, airr_mod: str = "airr", airr_key: str = "airr"
@@ -0,0 +1,108 @@
+import os
+import zipfile
+from datetime import datetime
+
+import awkward as ak
+import numpy as np
+import pandas as pd
+import pooch
+import pytest
+
+from scirpy import datasets
+
+
+def _write_zip(path, member, df, **kwargs):
+    """Write a data frame as the only member of a zip archive"""
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr(member, df.to_csv(index=False, **kwargs))
+    return path
+
+
+@pytest.fixture
+def mock_download(monkeypatch):
+    """Replace all network calls of the database loaders. Returns a function
+    to set the archive that is "downloaded"."""
+    archive = {}
+    monkeypatch.setattr(
+        datasets, "_latest_vdjdb_url", lambda: "https://example.com/vdjdb.zip"
+    )
+    monkeypatch.setattr(pooch, "retrieve", lambda *args, **kwargs: archive["path"])
+
+    def _set_archive(path):
+        archive["path"] = str(path)
+
+    return _set_archive
+
+
+def test_vdjdb(mock_download, tmp_path):
+    df = pd.DataFrame({c: ["x", "x", "x"] for c in datasets._VDJDB_COLS})
+    df["cdr3.alpha"] = ["CAVR", None, "CAAA"]
+    df["cdr3.beta"] = ["CASS", "CASR", None]
+    df["v.alpha"] = ["TRAV1", None, "TRAV2"]
+    df["species"] = ["HomoSapiens", None, "MusMusculus"]
+    mock_download(_write_zip(tmp_path / "vdjdb.zip", "vdjdb_full.txt", df, sep="\t"))
+
+    adata = datasets.vdjdb(cached=False, cache_path=tmp_path / "vdjdb.h5ad")
+
+    assert adata.obs_names.tolist() == ["0", "1", "2"]
+    chains = ak.to_list(adata.obsm["airr"])
+    assert [[c["locus"] for c in cell] for cell in chains] == [
+        ["TRA", "TRB"],
+        ["TRB"],
+        ["TRA"],
+    ]
+    assert [c["junction_aa"] for c in chains[0]] == ["CAVR", "CASS"]
+    assert chains[2][0]["v_call"] == "TRAV2"
+    assert pd.isna(adata.obs["species"].iloc[1])
+    assert (tmp_path / "vdjdb.h5ad").exists()
+
+
+def test_vdjdb_missing_table(mock_download, tmp_path):
+    df = pd.DataFrame({c: ["x"] for c in datasets._VDJDB_COLS})
+    mock_download(_write_zip(tmp_path / "vdjdb.zip", "other.txt", df, sep="\t"))
+
+    with pytest.raises(ValueError):
+        datasets.vdjdb(cached=False, cache_path=tmp_path / "vdjdb.h5ad")
+
+
+def test_iedb(mock_download, tmp_path):
+    df = pd.DataFrame({c: ["x"] * 4 for c in datasets._IEDB_COLS})
+    df["Chain 1 Type"] = ["alpha", "alpha", "heavy", "unknown"]
+    df["Chain 2 Type"] = ["beta", "beta", "light", "beta"]
+    for i in [1, 2]:
+        for gene in ["V", "D", "J"]:
+            df[f"Curated Chain {i} {gene} Gene"] = None
+            df[f"Calculated Chain {i} {gene} Gene"] = None
+    df["Chain 1 CDR3 Curated"] = ["cavr", "None", "CARR", "CAAA"]
+    df["Chain 1 CDR3 Calculated"] = [None, "cavk", None, None]
+    df["Chain 2 CDR3 Curated"] = ["CASS", "CASR", "CQQY", "CASK"]
+    df["Curated Chain 1 V Gene"] = ["TRAV1", "None", "IGHV1", None]
+    df["Calculated Chain 1 V Gene"] = [None, "trav2", None, None]
+    df["Curated Chain 2 V Gene"] = ["TRBV1", "TRBV2", "IGKV1-5", None]
+    df["Curated Chain 2 J Gene"] = ["TRBJ1", "TRBJ2", "IGKJ1", None]
+    # only set for the entry that is filtered out -> empty after filtering
+    df["Curated Chain 2 D Gene"] = [None, None, None, "TRBD1"]
+    mock_download(_write_zip(tmp_path / "iedb.zip", "receptor_full_v3.csv", df))
+
+    adata = datasets.iedb(cached=False, cache_path=tmp_path / "iedb.h5ad")
+
+    # entries with unsupported chain types are removed
+    assert adata.obs_names.tolist() == ["0", "1", "2"]
+    chains = ak.to_list(adata.obsm["airr"])
+    assert [[c["locus"] for c in cell] for cell in chains] == [
+        ["TRA", "TRB"],
+        ["TRA", "TRB"],
+        ["IGH", "IGK"],
+    ]
+    # missing curated values are replaced by the calculated ones
+    assert [c["junction_aa"] for c in chains[1]] == ["CAVK", "CASR"]
+    assert chains[1][0]["v_call"] == "TRAV2"
+    assert chains[0][0]["junction_aa"] == "CAVR"
+    # curated and calculated values both missing
+    assert [cell[1]["d_call"] for cell in chains] == [None, None, None]
+    assert np.all(adata.obs["Antigen"] == "x")
+    assert (tmp_path / "iedb.h5ad").exists()
+    # the date refers to the (possibly cached) raw download, not to the processing
+    assert adata.uns["DB"]["date_downloaded"] == (
+        datetime.fromtimestamp(os.path.getmtime(tmp_path / "iedb.zip")).isoformat()
+    )
@@ -1,5 +1,6 @@
 from functools import lru_cache
 
+import awkward as ak
 import numpy as np
 import pandas as pd
 import pandas.testing as pdt
@@ -19,6 +20,7 @@ from scirpy.io import (
     to_dandelion,
     write_airr,
 )
+from scirpy.io._convert_anndata import _from_airr_df
 from scirpy.io._io import _cdr3_from_junction, _infer_locus_from_gene_names
 from scirpy.util import DataHandler, _is_na
 
@@ -107,6 +109,43 @@ def test_airr_cell_empty():
     assert adata.shape == (1, 0)
 
 
+def test_from_airr_df():
+    """Building AnnData from a long-format chain table should yield the same
+    result as going through AirrCell objects"""
+    chains = pd.DataFrame(
+        {
+            "cell_id": ["cell2", "cell1", "cell2"],
+            "locus": ["TRA", "TRB", "TRB"],
+            "junction_aa": ["CASS", np.nan, "CAAA"],
+            "productive": [True, True, False],
+        }
+    )
+    obs = pd.DataFrame(
+        {"sample": ["A", "B", "B"]},
+        index=pd.Index(["cell1", "cell2", "cell3"], name="cell_id"),
+    )
+
+    cells = []
+    for cell_id, sample in obs["sample"].items():
+        ac = AirrCell(cell_id)
+        ac["sample"] = sample
+        cell_chains = chains.loc[chains["cell_id"] == cell_id].drop(columns="cell_id")
+        for tmp_chain in cell_chains.to_dict(orient="records"):
+            chain = AirrCell.empty_chain_dict()
+            chain.update(tmp_chain)
+            ac.add_chain(chain)
+        cells.append(ac)
+    expected = from_airr_cells(cells)
+
+    adata = _from_airr_df(obs, chains)
+
+    pdt.assert_frame_equal(adata.obs, expected.obs)
+    assert ak.to_list(adata.obsm["airr"]) == ak.to_list(expected.obsm["airr"])
+
+    with pytest.raises(ValueError):
+        _from_airr_df(obs.iloc[:1], chains)
+
+
 @pytest.mark.parametrize(
     "chain_dict,expected",
     [